@@ -1,9 +1,18 @@
 import os
+import shutil
+import pickle
 import logging
+import functools
+import itertools
+from importlib.metadata import version
 import psycopg2
+import numpy as np
 import pandas as pd
 import re
+import ahocorasick
 from dotenv import load_dotenv
+from joblib import Parallel, delayed
+from numba import njit, prange
 from tqdm import tqdm
 
 load_dotenv()
@@ -33,6 +42,21 @@ THERAPY_CONFIGS = {
     }
 }
 
+# Columns of recycle_bin.youtube_scraped_data needed for tagging and output
+DATA_COLUMNS = ['channel_id', 'video_id', 'title', 'description', 'tags']
+
+# Rows fetched per round-trip from the server-side cursor and scored together
+FETCH_CHUNK_SIZE = 10000
+
+# Parallel scoring: worker processes (-1 = all cores) and texts per task
+N_JOBS = -1
+SCORING_CHUNK_SIZE = 1000
+
+COMBINED_OUTPUT_FILE = "youtube_all_batches_tagged_with_keywords.csv"
+
+# Bump whenever load_keywords' return value changes shape, so old '.ac' caches are rebuilt
+KEYWORD_CACHE_VERSION = 2
+
 def connect_to_db():
     """DB connection using environment variables with validation."""
     db_config = {
@@ -58,116 +82,258 @@ def connect_to_db():
     logging.info("Connecting to DB")
     return psycopg2.connect(conn_str)
 
-def load_data(conn, batch_id):
-    """Fetch raw youtube data from DB for specific batch_id."""
-    # query = f"""
-    # SELECT * FROM auxo_master.youtube_tagged_data_v1 WHERE batch_id = {batch_id};
-    # """
-    query = f"""
-    SELECT * FROM recycle_bin.youtube_scraped_data;
-    """
-    df = pd.read_sql(query, conn)
-    logging.info(f"Fetched {len(df)} rows from DB for batch_id={batch_id}")
-    print(f"Data loaded: {len(df)} rows for batch_id={batch_id}")
-    return df
-
 def load_keywords(filename):
     """Load keywords from CSV segregated into categories."""
     keywords_df = pd.read_csv(filename)
     generic_terms = keywords_df['Generic'].dropna().str.split(',').explode().str.strip().str.lower().tolist()
     specialised_terms = keywords_df['Specialised'].dropna().str.split(',').explode().str.strip().str.lower().tolist()
     abbreviations = keywords_df['Abbreviations'].dropna().str.split(',').explode().str.strip().tolist()
+    # Drop empty entries (e.g. trailing commas) once here so the builders need no per-term guard
+    generic_terms = tuple(t for t in generic_terms if t)
+    specialised_terms = tuple(t for t in specialised_terms if t)
+    abbreviations = tuple(a for a in abbreviations if a)
+    ac_generic = build_automaton(generic_terms)
+    ac_spec = build_automaton(specialised_terms)
+    abbr_matcher = build_abbreviation_matcher(abbreviations)
     logging.info(f"Loaded keywords from {filename}")
-    return generic_terms, specialised_terms, abbreviations
+    return generic_terms, specialised_terms, abbr_matcher, ac_generic, ac_spec
+
+@functools.lru_cache(maxsize=None)
+def load_keywords_cached(filename):
+    """
+    load_keywords, memoized per process and persisted to a pickled '<filename>.ac'
+    sidecar. The sidecar is rebuilt whenever the keyword CSV is newer than it, or it
+    was written by another KEYWORD_CACHE_VERSION or pyahocorasick version.
+    """
+    cache_file = filename + '.ac'
+    cache_key = (KEYWORD_CACHE_VERSION, version('pyahocorasick'))
+    if os.path.exists(cache_file) and os.path.getmtime(cache_file) > os.path.getmtime(filename):
+        try:
+            with open(cache_file, 'rb') as f:
+                key, keywords = pickle.load(f)
+            if key == cache_key:
+                logging.info(f"Loaded cached keywords from {cache_file}")
+                return keywords
+            logging.info(f"Rebuilding keyword cache {cache_file} written by another version")
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable keyword cache {cache_file}: {e}")
+
+    keywords = load_keywords(filename)
+    try:
+        with open(cache_file, 'wb') as f:
+            pickle.dump((cache_key, keywords), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logging.warning(f"Could not write keyword cache {cache_file}: {e}")
+    return keywords
+
+def build_automaton(terms):
+    """
+    Build an Aho-Corasick automaton matching any of the (lowercased) terms as substrings.
+    Each term's value is its ((index, term), ...) positions in terms, so a term listed
+    twice in the keyword file still counts twice.
+    """
+    positions = {}
+    for i, term in enumerate(terms):
+        positions.setdefault(term, []).append((i, term))
+    automaton = ahocorasick.Automaton()
+    for term, term_positions in positions.items():
+        automaton.add_word(term, tuple(term_positions))
+    automaton.make_automaton()
+    return automaton
+
+def build_abbreviation_matcher(abbreviations):
+    """
+    Return (regex, expansions) for the abbreviations, or None if there are none.
+    regex is one case-sensitive whole-word alternation, longest first, inside a
+    lookahead so it reports the longest abbreviation starting at every position, even
+    where matches overlap. expansions maps each abbreviation to the ((index, abbr), ...)
+    positions of every abbreviation that is a whole-word prefix of it (itself
+    included), so a hit like 'PD-L1' also reports 'PD' as the per-abbreviation
+    search did.
+    """
+    unique = sorted(set(abbreviations), key=len, reverse=True)
+    if not unique:
+        return None
+    regex = re.compile(r"(?=\b(" + "|".join(re.escape(abbr) for abbr in unique) + r")\b)")
+    prefixes = [(i, abbr, re.compile(rf"{re.escape(abbr)}\b")) for i, abbr in enumerate(abbreviations)]
+    expansions = {
+        hit: tuple((i, abbr) for i, abbr, prefix in prefixes if prefix.match(hit))
+        for hit in unique
+    }
+    return regex, expansions
+
+def find_terms(automaton, text_lower):
+    """
+    Return the automaton terms occurring in text_lower, in keyword-file order and
+    repeated as often as they are listed, in a single pass over the text.
+    """
+    if automaton.kind != ahocorasick.AHOCORASICK:
+        return []
+    hits = {term_positions for _, term_positions in automaton.iter(text_lower)}
+    return [term for _, term in sorted(itertools.chain.from_iterable(hits))]
+
+def find_abbreviations(abbr_matcher, text):
+    """Return the abbreviations occurring in text as whole words, in keyword-file order."""
+    if abbr_matcher is None:
+        return []
+    regex, expansions = abbr_matcher
+    hits = {expansions[hit] for hit in regex.findall(text)}
+    if not hits:
+        return []
+    return [abbr for _, abbr in sorted(set(itertools.chain.from_iterable(hits)))]
+
+def match_keywords(text, text_lower, ac_generic, ac_spec, abbr_matcher):
+    """
+    Return the number of generic, specialised and abbreviation matches in text
+    (counting terms listed twice twice, as the keyword file does), plus the list of
+    matched keywords from any category. text_lower is text already lowercased
+    (terms match on it, abbreviations on text).
+    """
+    matched_generic = find_terms(ac_generic, text_lower)
+    matched_spec = find_terms(ac_spec, text_lower)
+    matched_abbr = find_abbreviations(abbr_matcher, text)
 
-def calculate_tag_score(text, generic_terms, specialised_terms, abbreviations):
+    matched_keywords = matched_generic + matched_spec + matched_abbr
+    return len(matched_generic), len(matched_spec), len(matched_abbr), matched_keywords
+
+@njit(cache=True, parallel=True)
+def score_rows(num_generic, num_spec, num_abbr, out):
     """
-    Return tag score and matched keywords based on updated logic:
+    Write the tag score for each row into out, based on updated logic:
     1 = only generic found (less than 3),
     2 = generic + specialised OR generic + abbreviation OR only specialised found,
     3 = only abbreviation found,
     4 = only generic found and >= 3 generic keywords,
     0 = none found.
-    Also returns list of matched keywords from any category.
     """
-    text_lower = text.lower()
-    matched_keywords = []
-
-    found_generic = any(term and (term in text_lower) for term in generic_terms)
-    if found_generic:
-        matched_generic = [term for term in generic_terms if term and term in text_lower]
-        matched_keywords.extend(matched_generic)
+    for i in prange(num_generic.shape[0]):
+        found_generic = num_generic[i] > 0
+        found_specialised = num_spec[i] > 0
+        found_abbreviation = num_abbr[i] > 0
+        if found_generic and not (found_specialised or found_abbreviation):
+            out[i] = 4 if num_generic[i] >= 3 else 1
+        elif (found_generic and (found_specialised or found_abbreviation)) or (found_specialised and not found_generic and not found_abbreviation):
+            out[i] = 2
+        elif found_abbreviation and not found_generic and not found_specialised:
+            out[i] = 3
+        else:
+            out[i] = 0
 
-    found_specialised = any(term and (term in text_lower) for term in specialised_terms)
-    if found_specialised:
-        matched_spec = [term for term in specialised_terms if term and term in text_lower]
-        matched_keywords.extend(matched_spec)
+def score_chunk(texts, texts_lower, ac_generic, ac_spec, abbr_matcher):
+    """Match keywords for a chunk of texts; runs inside a joblib worker process."""
+    return [
+        match_keywords(text, text_lower, ac_generic, ac_spec, abbr_matcher)
+        for text, text_lower in zip(texts, texts_lower)
+    ]
 
-    found_abbreviation = any(
-        abbr and re.search(rf"\b{re.escape(abbr)}\b", text) for abbr in abbreviations
+def score_frame(df, progress, ac_generic, ac_spec, abbr_matcher):
+    """
+    Add combined_text, tag_score, matched_keywords and is_tagged columns to df in place,
+    advancing the batch's tqdm bar progress by each scored row.
+    """
+    # Combine text fields for keyword search (case is kept: abbreviations match case-sensitively)
+    df['combined_text'] = (
+        df['title'].fillna('') + ' ' + df['description'].fillna('') + ' ' + df['tags'].fillna('')
     )
-    if found_abbreviation:
-        matched_abbr = [abbr for abbr in abbreviations if abbr and re.search(rf"\b{re.escape(abbr)}\b", text)]
-        matched_keywords.extend(matched_abbr)
 
-    # Count matched generic keywords
-    num_matched_generic = len(matched_generic) if found_generic else 0
+    # Lowercase in one vectorized Arrow pass instead of str.lower() per row in the workers
+    texts = df['combined_text'].to_numpy(dtype=object)
+    texts_lower = df['combined_text'].str.lower().to_numpy(dtype=object)
 
-    # Apply updated scoring logic
-    if found_generic and not (found_specialised or found_abbreviation):
-        if num_matched_generic >= 3:
-            score = 4
-        else:
-            score = 1
-    elif (found_generic and (found_specialised or found_abbreviation)) or (found_specialised and not found_generic and not found_abbreviation):
-        score = 2
-    elif found_abbreviation and not found_generic and not found_specialised:
-        score = 3
-    else:
-        score = 0
+    # Match keywords across worker processes
+    bounds = range(0, len(texts), SCORING_CHUNK_SIZE)
+    parallel = Parallel(n_jobs=N_JOBS, backend='loky', return_as='generator')
+    results = []
+    for chunk_results in parallel(
+        delayed(score_chunk)(
+            texts[i:i + SCORING_CHUNK_SIZE], texts_lower[i:i + SCORING_CHUNK_SIZE],
+            ac_generic, ac_spec, abbr_matcher
+        )
+        for i in bounds
+    ):
+        results.extend(chunk_results)
+        progress.update(len(chunk_results))
 
-    return score, matched_keywords
+    # Apply new tagging logic on the per-row match counts, keep matched keywords alongside
+    counts = np.array([r[:3] for r in results], dtype=np.uint32).reshape(-1, 3)
+    scores = np.empty(len(results), dtype=np.int64)
+    score_rows(counts[:, 0], counts[:, 1], counts[:, 2], scores)
+    df['tag_score'] = scores
+    df['matched_keywords'] = [r[3] for r in results]
+    df['is_tagged'] = df['tag_score'] > 0
 
 def process_batch(conn, batch_id, config):
-    """Process a single batch with its specific configuration."""
+    """
+    Process a single batch with its specific configuration.
+
+    Rows are streamed from a named (server-side) cursor FETCH_CHUNK_SIZE at a
+    time, scored and appended to the batch output CSV, so memory stays bounded
+    by the chunk size rather than the table size. Returns (output_file, total_rows).
+    """
     print(f"\n{'='*60}")
     print(f"Processing Batch ID: {batch_id}")
     print(f"Keyword File: {config['keyword_file']}")
     print(f"{'='*60}\n")
-    
-    # Load data and keywords
-    df = load_data(conn, batch_id)
-    generic_terms, specialised_terms, abbreviations = load_keywords(config['keyword_file'])
-
-    # Combine text fields for keyword search
-    df['combined_text'] = df[['title', 'description', 'tags']].fillna("").agg(" ".join, axis=1)
-
-    tqdm.pandas(desc=f"Scoring videos (batch {batch_id})")
-    
-    # Apply new tagging logic, get score and matched keywords
-    results = df['combined_text'].progress_apply(
-        lambda x: calculate_tag_score(x, generic_terms, specialised_terms, abbreviations)
-    )
-    # Unpack score and matched keywords into two new columns
-    df[['tag_score', 'matched_keywords']] = pd.DataFrame(results.tolist(), index=df.index)
-    df['is_tagged'] = df['tag_score'] > 0
 
-    # Print results for all videos including those with zero score
-    for idx, row in df.iterrows():
-        video_id = row['video_id'] if 'video_id' in row else idx
-        print(f"Video ID: {video_id} - Score: {row['tag_score']}, Matched Keywords: {row['matched_keywords']}")
+    generic_terms, specialised_terms, abbr_matcher, ac_generic, ac_spec = load_keywords_cached(config['keyword_file'])
+
+    output_file = f"youtube_tagged_batch_{batch_id}_with_keywords.csv"
+    total_rows = 0
+    tagged_rows = 0
+
+    # query = f"""
+    # SELECT * FROM auxo_master.youtube_tagged_data_v1 WHERE batch_id = {batch_id};
+    # """
+    query = f"SELECT {', '.join(DATA_COLUMNS)} FROM recycle_bin.youtube_scraped_data"
+    # A named cursor only knows its row count once drained, so size the progress bar up front
+    with conn.cursor() as count_cur:
+        count_cur.execute("SELECT COUNT(*) FROM recycle_bin.youtube_scraped_data")
+        expected_rows = count_cur.fetchone()[0]
+    progress = tqdm(total=expected_rows, desc=f"Scoring videos (batch {batch_id})", unit="video")
+    with progress, conn.cursor(name=f"yt_batch_{batch_id}") as cur:
+        cur.itersize = FETCH_CHUNK_SIZE
+        cur.execute(query)
+        while True:
+            rows = cur.fetchmany(FETCH_CHUNK_SIZE)
+            if not rows:
+                break
+            # Arrow-backed strings so concatenation below runs in Arrow compute kernels
+            df = pd.DataFrame(rows, columns=DATA_COLUMNS).astype('string[pyarrow]')
+            score_frame(df, progress, ac_generic, ac_spec, abbr_matcher)
+
+            # Preview the first rows; every row's score and keywords are in the output CSV
+            first_chunk = total_rows == 0
+            if first_chunk:
+                print(df[['video_id', 'tag_score', 'matched_keywords']].head(20).to_string(index=False))
+
+            # Save all results including keywords in CSV, header only with the first chunk
+            df.to_csv(output_file, mode='w' if first_chunk else 'a', header=first_chunk, index=False)
+            total_rows += len(df)
+            tagged_rows += int(df['is_tagged'].sum())
+
+    logging.info(f"Fetched {total_rows} rows from DB for batch_id={batch_id}")
 
     print(f"\nBatch {batch_id} Results:")
-    print(f"  Total videos: {len(df)}")
-    print(f"  Tagged videos (score > 0): {len(df[df['is_tagged']])}")
-    print(f"  Not tagged videos (score = 0): {len(df[df['tag_score'] == 0])}")
+    print(f"  Total videos: {total_rows}")
+    print(f"  Tagged videos (score > 0): {tagged_rows}")
+    print(f"  Not tagged videos (score = 0): {total_rows - tagged_rows}")
 
-    # Save all results including keywords in CSV
-    output_file = f"youtube_tagged_batch_{batch_id}_with_keywords.csv"
-    df.to_csv(output_file, index=False)
+    if not total_rows:
+        print("  No rows to save\n")
+        return None, 0
     print(f"  Saved detailed results including keywords to: {output_file}\n")
-    
-    return df
+
+    return output_file, total_rows
+
+def combine_batch_outputs(batch_files, combined_file):
+    """Concatenate batch CSVs into combined_file, keeping only the first header."""
+    with open(combined_file, 'w', encoding='utf-8', newline='') as out:
+        for n, batch_file in enumerate(batch_files):
+            with open(batch_file, encoding='utf-8', newline='') as src:
+                header = src.readline()
+                if n == 0:
+                    out.write(header)
+                shutil.copyfileobj(src, out)
 
 def main():
     """Main pipeline"""
@@ -175,7 +341,8 @@ def main():
     conn = connect_to_db()
 
     batch_ids_to_process = [1]
-    all_batches = []
+    batch_files = []
+    total_rows = 0
 
     for batch_id in batch_ids_to_process:
         if batch_id not in THERAPY_CONFIGS:
@@ -183,14 +350,15 @@ def main():
             logging.warning(f"No configuration for batch_id {batch_id}")
             continue
         config = THERAPY_CONFIGS[batch_id]
-        batch_df = process_batch(conn, batch_id, config)
-        all_batches.append(batch_df)
-
-    if all_batches:
-        combined = pd.concat(all_batches, ignore_index=True)
-        combined.to_csv("youtube_all_batches_tagged_with_keywords.csv", index=False)
-        print(f"\nTotal tagged videos across all batches: {len(combined)}")
-        logging.info(f"Total tagged videos: {len(combined)}")
+        output_file, batch_rows = process_batch(conn, batch_id, config)
+        if output_file:
+            batch_files.append(output_file)
+            total_rows += batch_rows
+
+    if batch_files:
+        combine_batch_outputs(batch_files, COMBINED_OUTPUT_FILE)
+        print(f"\nTotal tagged videos across all batches: {total_rows}")
+        logging.info(f"Total tagged videos: {total_rows}")
 
     conn.close()
     logging.info("Pipeline completed successfully")
@@ -1,15 +1,27 @@
+import io
+import atexit
 import os
+import sys
+import csv
+import itertools
+import random
+import orjson
+import signal
+import queue
+from collections import deque
 import time
-import json
-import pandas as pd
-from datetime import datetime
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 from googleapiclient.errors import HttpError
 from googleapiclient.discovery import build
-import psycopg2
-from psycopg2.extras import execute_values
+from googleapiclient.model import JsonModel
+import httplib2
+from psycopg2.pool import ThreadedConnectionPool
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from contextlib import contextmanager
 
 # ========= ENV & GLOBAL CONFIG =========
@@ -29,8 +41,81 @@ API_KEYS = [k.strip() for k in API_KEYS if k and k.strip()]
 
 INPUT_FILE = "Channel_name_23012026.csv"
 CHECKPOINT_FILE = "youtube_checkpoint_db.json"
+HANDLE_CACHE_FILE = "handle_id_cache.jsonl"  # append-only handle -> channel_id lookups, later lines win
+HANDLE_MISS_TTL = 7 * 24 * 3600  # seconds before an unresolvable handle is looked up again
 BATCH_SIZE = 10
+CHANNEL_INFO_BATCH = 50  # channels per channels.list call (the API maximum)
+WRITE_BATCH_RECORDS = 500  # DB writer flushes once this many records are buffered
+INSERT_QUEUE_MAX_ITEMS = 64  # pages waiting for the DB writer before workers block
+# Flushes this large (every size-triggered one) are loaded via COPY; smaller ones use unnest() arrays
+COPY_MIN_RECORDS = WRITE_BATCH_RECORDS
+# (column, PostgreSQL type) of recycle_bin.youtube_scraped_data in record-tuple order
+COLUMN_TYPES = (
+    ('channel_id', 'varchar'), ('channel_handle', 'varchar'), ('channel_title', 'text'),
+    ('channel_description', 'text'), ('subscriber_count', 'bigint'), ('video_count', 'bigint'),
+    ('view_count', 'bigint'), ('uploads_playlist_id', 'varchar'), ('country', 'varchar'),
+    ('published_at', 'timestamp'), ('topic_categories', 'text'), ('made_for_kids', 'boolean'),
+    ('privacy_status', 'varchar'), ('video_id', 'varchar'), ('title', 'text'),
+    ('description', 'text'), ('video_published', 'timestamp'), ('video_url', 'text'),
+    ('channel_title_video', 'text'), ('tags', 'text'), ('likes', 'bigint'),
+    ('comments', 'bigint'), ('views', 'bigint'), ('duration', 'varchar'),
+    ('definition', 'varchar'), ('category_id', 'varchar'), ('license', 'varchar'),
+    ('video_made_for_kids', 'boolean')
+)
+COLUMNS = tuple(c for c, _ in COLUMN_TYPES)
+CHANNEL_COLUMNS = COLUMNS[:13]  # channel-level fields that open every record tuple
+_COLUMN_LIST = ", ".join(COLUMNS)
+_VIDEO_ID_INDEX = COLUMNS.index("video_id")
+_ON_CONFLICT_SQL = """
+    ON CONFLICT (channel_id, video_id) DO UPDATE SET
+        channel_title = EXCLUDED.channel_title,
+        title = EXCLUDED.title,
+        views = EXCLUDED.views,
+        likes = EXCLUDED.likes,
+        comments = EXCLUDED.comments,
+        scraped_at = CURRENT_TIMESTAMP
+"""
+UNNEST_INSERT_SQL = f"""
+    INSERT INTO recycle_bin.youtube_scraped_data ({_COLUMN_LIST})
+    SELECT * FROM unnest({", ".join(f"%s::{t}[]" for _, t in COLUMN_TYPES)}) AS t({_COLUMN_LIST})
+    {_ON_CONFLICT_SQL}
+"""
+COPY_STAGING_SQL = f"COPY tmp_youtube ({_COLUMN_LIST}) FROM STDIN WITH (FORMAT text)"
+STAGING_INSERT_SQL = f"""
+    INSERT INTO recycle_bin.youtube_scraped_data ({_COLUMN_LIST})
+    SELECT {_COLUMN_LIST} FROM tmp_youtube
+    {_ON_CONFLICT_SQL}
+"""
+
+# Descriptions are the bulk of each row; MAX_DESCRIPTION_CHARS=0 in .env stores them empty and skips downloading them
+MAX_DESCRIPTION_CHARS = int(os.getenv('MAX_DESCRIPTION_CHARS', 1000))
+_DESCRIPTION_FIELD = "description," if MAX_DESCRIPTION_CHARS else ""
+MAX_TITLE_CHARS = 300
+CHANNEL_PARTS = "snippet,statistics,topicDetails,status"  # uploads playlist is derived from the id
+VIDEO_PARTS = "snippet,statistics,contentDetails,status"
+# fields= masks: only what the record builders read comes over the wire
+CHANNEL_FIELDS = (
+    f"items(id,snippet(title,customUrl,{_DESCRIPTION_FIELD}country,publishedAt),"
+    "statistics(subscriberCount,videoCount,viewCount),"
+    "topicDetails/topicCategories,status(madeForKids,privacyStatus))"
+)
+VIDEO_FIELDS = (
+    f"items(id,snippet(title,{_DESCRIPTION_FIELD}publishedAt,channelTitle,tags,categoryId),"
+    "statistics(likeCount,commentCount,viewCount),contentDetails(duration,definition),"
+    "status(license,madeForKids))"
+)
 RATE_LIMIT_RETRY_DELAY = 60  # not heavily used, but available
+REQUESTS_PER_SECOND_PER_KEY = 5  # API request pacing for each key's worker
+REQUEST_BURST_PER_KEY = 10  # calls a key may make back to back after being idle
+WORKERS_PER_KEY = 4  # channel workers sharing each key's client and rate limiter
+API_POOL_WORKERS = 8  # threads per key for concurrent API calls (handle lookups, videos.list), shared by its workers
+VIDEO_BATCH_MAX_WAIT = 0.1  # seconds a short videos.list page waits to share a call with other channels
+HTTP_TIMEOUT = 30  # seconds before a stalled API connection is abandoned
+# Lowercased error-body markers of a key that fails every call (invalid, expired, blocked, or API not enabled)
+KEY_ERROR_MARKERS = (
+    b'keyinvalid', b'keyexpired', b'accessnotconfigured', b'iprefererblocked',
+    b'api_key_', b'service_disabled', b'valid api key'
+)
 
 os.makedirs("logs", exist_ok=True)
 LOG_FILE = os.path.join("logs", f"scraper_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
@@ -39,6 +124,7 @@ LOG_FILE = os.path.join("logs", f"scraper_{datetime.now().strftime('%Y%m%d_%H%M%
 
 logger = logging.getLogger("youtube_scraper")
 logger.setLevel(logging.INFO)
+logger.propagate = False  # the handlers below are the only output; nothing goes to the root logger too
 
 # Console handler
 console_handler = logging.StreamHandler()
@@ -51,8 +137,17 @@ file_handler = RotatingFileHandler(LOG_FILE, maxBytes=10_000_000, backupCount=5,
 file_handler.setLevel(logging.INFO)
 file_handler.setFormatter(console_fmt)
 
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+# Console output only for interactive runs, since redirected runs have the log file;
+# LOG_TO_CONSOLE=1 or 0 in .env forces it on or off (e.g. 1 for docker/systemd, which collect stderr)
+LOG_TO_CONSOLE = os.getenv('LOG_TO_CONSOLE', '1' if sys.stderr.isatty() else '0') == '1'
+handlers = [console_handler, file_handler] if LOG_TO_CONSOLE else [file_handler]
+
+# Threads format records and enqueue them (QueueHandler.prepare); a listener thread does the file and console I/O
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+logger.addHandler(QueueHandler(log_queue))
+log_listener.start()
+atexit.register(log_listener.stop)
 
 # Suppress googleapiclient discovery cache noise[web:16][web:17]
 logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
@@ -64,20 +159,236 @@ logger.info(f"📁 Log file: {LOG_FILE}")
 logger.info(f"🔑 Loaded {len(API_KEYS)} API keys")
 
 
+# ========= HELPERS =========
+
+def _capped(text, limit):
+    """Return text (None as '') cut to at most limit characters, slicing only when it is longer."""
+    if not text:
+        return ''
+    return text if len(text) <= limit else text[:limit]
+
+
+def _next_quota_reset():
+    """Return the next midnight Pacific (when API quotas reset) in local time, or None if tz data is missing."""
+    try:
+        pacific = ZoneInfo("America/Los_Angeles")
+    except Exception:
+        return None
+    now = datetime.now(pacific)
+    reset = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return reset.astimezone()
+
+
+def _error_body(e):
+    """Return an HttpError's raw response body as lowercased bytes."""
+    body = e.content or b''
+    if isinstance(body, str):
+        body = body.encode('utf-8', 'replace')
+    return body.lower()
+
+
+class OrjsonModel(JsonModel):
+    """JsonModel that parses API responses with orjson, straight from the response bytes."""
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode('utf-8') if isinstance(content, bytes) else content
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
+
+def _uploads_playlist_id(channel_id):
+    """A channel's uploads playlist is its id with the UC prefix swapped for UU."""
+    return 'UU' + channel_id[2:] if channel_id.startswith('UC') else None
+
+
+def _channel_info(ch):
+    """Build the channel-level record fields from a channels.list item."""
+    snippet = ch.get('snippet', {})
+    stats = ch.get('statistics', {})
+    topic_details = ch.get('topicDetails', {})
+    status = ch.get('status', {})
+    return {
+        'channel_id': ch['id'],
+        'channel_handle': snippet.get('customUrl', ''),
+        'channel_title': _capped(snippet.get('title'), MAX_TITLE_CHARS),
+        'channel_description': _capped(snippet.get('description'), MAX_DESCRIPTION_CHARS),
+        'subscriber_count': int(stats.get('subscriberCount', 0) or 0),
+        'video_count': int(stats.get('videoCount', 0) or 0),
+        'view_count': int(stats.get('viewCount', 0) or 0),
+        'uploads_playlist_id': _uploads_playlist_id(ch['id']),
+        'country': snippet.get('country', ''),
+        'published_at': snippet.get('publishedAt'),
+        'topic_categories': '|'.join(topic_details.get('topicCategories', [])),
+        'made_for_kids': status.get('madeForKids', False),
+        'privacy_status': status.get('privacyStatus', '')
+    }
+
+
+def _video_record(ch_prefix, item):
+    """Build a record tuple (in COLUMNS order) from a channel prefix and a videos.list item."""
+    st = item.get('statistics', {})
+    sn = item.get('snippet', {})
+    cd = item.get('contentDetails', {})
+    stt = item.get('status', {})
+    return ch_prefix + (
+        item['id'],
+        _capped(sn.get('title'), MAX_TITLE_CHARS),
+        _capped(sn.get('description'), MAX_DESCRIPTION_CHARS),
+        sn.get('publishedAt'),
+        f"https://www.youtube.com/watch?v={item['id']}",
+        sn.get('channelTitle', ''),
+        ','.join(sn.get('tags') or ()),
+        int(st.get('likeCount', 0) or 0),
+        int(st.get('commentCount', 0) or 0),
+        int(st.get('viewCount', 0) or 0),
+        cd.get('duration', ''),
+        cd.get('definition', ''),
+        sn.get('categoryId', ''),
+        stt.get('license', ''),
+        stt.get('madeForKids', False)
+    )
+
+
+def _format_value_for_copy(value):
+    """Render one value as a field of PostgreSQL's COPY text format."""
+    if value is None:
+        return r'\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class RateLimiter:
+    """
+    GCRA token bucket shared by every thread that uses it: sustains rps calls per
+    second and lets up to burst calls through back to back after an idle spell.
+    """
+
+    def __init__(self, rps, burst=1):
+        self.interval = 1.0 / rps
+        self.tolerance = (burst - 1) * self.interval
+        self.tat = time.monotonic()  # theoretical arrival time of the next call
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            tat = max(now, self.tat)
+            wait = max(0.0, tat - self.tolerance - now)
+            self.tat = tat + self.interval
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for at least seconds, e.g. after the key is rate limited."""
+        with self.lock:
+            self.tat = max(self.tat, time.monotonic() + seconds + self.tolerance)
+
+
+class VideoBatcher:
+    """
+    Coalesce short videos.list pages (a channel's last playlist page) from the channels
+    of one API key into shared calls of up to 50 ids. A page waits at most max_wait for
+    company; dispatch(group) is handed each [(ch_prefix, ids, future), ...] group.
+    """
+
+    def __init__(self, dispatch, max_ids=50, max_wait=VIDEO_BATCH_MAX_WAIT):
+        self.dispatch = dispatch
+        self.max_ids = max_ids
+        self.max_wait = max_wait
+        self.pending = []
+        self.pending_ids = 0
+        self.deadline = None
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._flusher, name="video-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, ch_prefix, ids):
+        fut = Future()
+        with self.cond:
+            if self.pending_ids + len(ids) > self.max_ids:
+                self._flush()
+            self.pending.append((ch_prefix, ids, fut))
+            self.pending_ids += len(ids)
+            if self.pending_ids >= self.max_ids:
+                self._flush()
+            elif self.deadline is None:
+                self.deadline = time.monotonic() + self.max_wait
+                self.cond.notify()
+        return fut
+
+    def close(self):
+        with self.cond:
+            self._flush()
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _flush(self):
+        """Hand the pending pages to dispatch. Call under cond."""
+        if self.pending:
+            self.dispatch(self.pending)
+        self.pending = []
+        self.pending_ids = 0
+        self.deadline = None
+
+    def _flusher(self):
+        with self.cond:
+            while not self.closed:
+                if self.deadline is None:
+                    self.cond.wait()
+                    continue
+                wait = self.deadline - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+                else:
+                    self._flush()
+
+
 # ========= SCRAPER CLASS =========
 
 class YouTubeScraper:
     def __init__(self):
-        self.api_key_index = 0
+        # Pooled connections: the DB writer's connection plus short-lived lookups
+        self.pool = ThreadedConnectionPool(minconn=2, maxconn=len(API_KEYS) + 2, **DB_CONFIG)
+        self.write_conn = None  # long-lived connection for inserts, committed per checkpoint batch
+        self.clients = {}  # api_key -> built YouTube service object, built by run() before the workers start
+        self.stop_requested = threading.Event()  # set by Ctrl+C: finish in-flight channels, then checkpoint and exit
+        self.abort_requested = threading.Event()  # set by a second Ctrl+C: leave in-flight channels at the next page
+        self.writer_failed = False  # set by db_writer when a flush fails; the run stops without writing more
+        # api_key -> that key's API pool; per key so a rate-limited key's paused calls can't hold up other keys
+        self.api_pools = {}
+        self.local = threading.local()  # per-thread state (the key's rate limiter, own Http)
+        self.limiters = {}  # api_key -> RateLimiter shared by that key's workers and their API-pool calls
+        self.exhausted_keys = set()  # keys retired this run: daily quota ran out, or the key was rejected
+        self.rejected_keys = set()  # the subset of exhausted_keys retired for being rejected (invalid, blocked)
+        self.batchers = {}  # api_key -> VideoBatcher for that key's short videos.list pages
         self.checkpoint = self.load_checkpoint()
+        self.handle_cache = self.load_handle_cache()  # handle key -> (channel_id or None, resolved_at)
+        self.handle_cache_lock = threading.Lock()
         self.setup_database()
+        self.processed_channels = self.load_processed_channels()
+        self.resume_tokens = self.load_resume_tokens()  # partial channel_id -> next page token, kept current by the writer
         logger.info(f"✅ Initialized. Resume from row {self.checkpoint.get('processed_rows', 0)}")
 
     @contextmanager
     def get_db_connection(self):
         conn = None
         try:
-            conn = psycopg2.connect(**DB_CONFIG)
+            conn = self.pool.getconn()
             yield conn
         except Exception as e:
             if conn:
@@ -86,7 +397,7 @@ class YouTubeScraper:
             raise
         finally:
             if conn:
-                conn.close()
+                self.pool.putconn(conn)
 
     def setup_database(self):
         with self.get_db_connection() as conn:
@@ -133,235 +444,417 @@ class YouTubeScraper:
                 PRIMARY KEY (channel_id, video_id)
             );
             """)
+            # Channels with some pages committed but not all; after a restart they resume from
+            # page_token, the playlist page after the last committed one (NULL: from the start)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS recycle_bin.youtube_scrape_partial (
+                channel_id VARCHAR(255) PRIMARY KEY,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                page_token VARCHAR(255)
+            );
+            ALTER TABLE recycle_bin.youtube_scrape_partial ADD COLUMN IF NOT EXISTS page_token VARCHAR(255);
+            """)
             conn.commit()
             cur.close()
             logger.info("✅ DB check complete, table ready")
 
     def setup_youtube_api(self, api_key):
-        # Disable discovery cache to avoid file_cache warnings[web:17]
-        return build("youtube", "v3", developerKey=api_key, cache_discovery=False)
+        # Disable discovery cache to avoid file_cache warnings[web:17];
+        # static_discovery loads the discovery doc bundled with the library instead of fetching it.
+        # Each client gets its own keep-alive Http (httplib2 is not thread-safe, so it is never shared).
+        return build(
+            "youtube", "v3",
+            developerKey=api_key,
+            http=httplib2.Http(timeout=HTTP_TIMEOUT),
+            model=OrjsonModel(data_wrapper=False),
+            cache_discovery=False,
+            static_discovery=True
+        )
 
-    def _next_key_index(self):
-        idx = self.api_key_index % len(API_KEYS)
-        self.api_key_index += 1
-        return idx
+    def _execute_with_retry(self, req, max_tries=3, base=1.0, cap=30.0):
+        """
+        Execute an API request, paced by the calling worker's rate limiter, retrying
+        5xx and per-user rate-limit errors with exponential backoff and jitter, or after
+        exactly the server's Retry-After when it sends one. A rate-limit error pauses
+        the whole key's limiter, so its other threads back off too instead of piling
+        on. Quota errors and other client errors are raised immediately.
+        """
+        limiter = getattr(self.local, 'limiter', None)
+        for attempt in range(max_tries):
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                # API-pool threads carry their own Http: httplib2 connections can't be shared across threads
+                return req.execute(http=getattr(self.local, 'http', None))
+            except HttpError as e:
+                status = getattr(e.resp, 'status', None)
+                rate_limited = status == 429 or (
+                    status == 403 and 'userratelimitexceeded' in str(e).lower()
+                )
+                retryable = rate_limited or status in (500, 502, 503, 504)
+                if not retryable or attempt == max_tries - 1:
+                    raise
+                retry_after = e.resp.get('retry-after', '')
+                if retry_after.isdigit():
+                    delay = float(retry_after)
+                else:
+                    delay = min(cap, base * 2 ** attempt) + random.uniform(0, 0.5)
+                logger.warning("⏳ HTTP %s, retrying in %.1fs (attempt %d/%d)", status, delay, attempt + 1, max_tries)
+                if rate_limited and limiter is not None:
+                    limiter.pause(delay)  # the next acquire() waits it out
+                else:
+                    time.sleep(delay)
 
-    def test_api_key(self, api_key, key_num):
-        """Test single key; return True if usable, False if quota-exhausted/invalid."""
-        try:
-            yt = self.setup_youtube_api(api_key)
-            req = yt.channels().list(part="id", id="UC_x5XG1OV2P6uZZ5FSM9Ttw", maxResults=1)
-            req.execute()
-            return True
-        except HttpError as e:
-            msg = str(e).lower()
-            if 'quotaexceeded' in msg or 'dailylimitexceeded' in msg:
-                logger.warning(f"🔒 Key {key_num} quota exhausted")
-                return False
-            if 'badrequest' in msg or 'invalid' in msg:
-                logger.warning(f"❌ Key {key_num} invalid/bad request")
-                return False
-            logger.warning(f"⚠️ Key {key_num} other HttpError: {e}")
+    @staticmethod
+    def is_quota_error(e):
+        # Quota errors are always 403s; match the raw body rather than str(e), which re-parses the JSON
+        if getattr(e.resp, 'status', None) != 403:
             return False
-        except Exception as e:
-            logger.warning(f"⚠️ Key {key_num} error: {e}")
-            return False
-
-    def get_working_api_key(self):
-        """Rotate through all keys and return first working one. Stop if none."""
-        if not API_KEYS:
-            logger.error("🛑 No API keys loaded")
-            return None
-
-        tried = set()
-        while len(tried) < len(API_KEYS):
-            idx = self._next_key_index()
-            if idx in tried:
-                continue
-            tried.add(idx)
-
-            api_key = API_KEYS[idx]
-            key_num = idx + 1
+        body = _error_body(e)
+        return b'quotaexceeded' in body or b'dailylimitexceeded' in body
 
-            if self.test_api_key(api_key, key_num):
-                logger.info(f"🔑 Using API key {key_num}")
-                return api_key
-
-        logger.error("🛑 ALL API KEYS EXHAUSTED - Stopping")
-        return None
+    @staticmethod
+    def is_key_error(e):
+        """
+        True for errors that fail every call made with the key, not just this one: quota
+        exhaustion, or a 400/403 for an invalid, expired or blocked key. The worker
+        retires the key and hands its window back instead of skipping channels.
+        """
+        if YouTubeScraper.is_quota_error(e):
+            return True
+        if getattr(e.resp, 'status', None) not in (400, 403):
+            return False
+        body = _error_body(e)
+        return any(marker in body for marker in KEY_ERROR_MARKERS)
 
-    def get_channel_id_from_handle(self, youtube, handle):
+    def lookup_channel(self, youtube, handle):
+        """
+        Resolve handle to (channel_id, info). The forHandle lookup requests every channel
+        part, so a hit also yields the channel's details (info) for the same 1 quota unit.
+        Cached ids and the search.list fallback return info None. Results, including
+        misses (for HANDLE_MISS_TTL), are remembered in the handle cache.
+        """
+        handle_clean = handle.strip().lstrip('@')
+        key = handle_clean.lower()
+        cached = self.handle_cache.get(key)
+        if cached is not None:
+            channel_id, resolved_at = cached
+            if channel_id or time.time() - resolved_at < HANDLE_MISS_TTL:
+                return channel_id, None
         try:
-            handle_clean = handle.strip().lstrip('@')
+            # channels.list by handle costs 1 quota unit; search.list costs 100
+            req = youtube.channels().list(part=CHANNEL_PARTS, forHandle=f"@{handle_clean}", fields=CHANNEL_FIELDS)
+            res = self._execute_with_retry(req)
+            if res.get('items'):
+                ch = res['items'][0]
+                self.cache_handle(key, ch['id'])
+                return ch['id'], _channel_info(ch)
+
+            # Fall back to search for the rare input that is not an exact handle
             req = youtube.search().list(
                 part="snippet",
                 q=handle_clean,
                 type="channel",
-                maxResults=1
+                maxResults=1,
+                fields="items/snippet/channelId"
             )
-            res = req.execute()
-            if res.get('items'):
-                return res['items'][0]['snippet']['channelId']
-            return None
+            res = self._execute_with_retry(req)
+            channel_id = res['items'][0]['snippet']['channelId'] if res.get('items') else None
+            self.cache_handle(key, channel_id)
+            return channel_id, None
         except HttpError as e:
-            msg = str(e).lower()
-            if 'quotaexceeded' in msg:
-                logger.warning(f"Quota exceeded while resolving handle {handle}")
+            if self.is_quota_error(e):
+                logger.warning("Quota exceeded while resolving handle %s", handle)
             raise
-        except Exception as e:
-            logger.error(f"Error finding channel {handle}: {e}")
-            return None
 
-    def get_channel_info(self, youtube, channel_id):
+    def get_channels_info(self, youtube, channel_ids):
+        """Fetch details for up to 50 channels in one call; return {channel_id: info}."""
+        infos = {}
         try:
             req = youtube.channels().list(
-                part="snippet,statistics,contentDetails,topicDetails,status",
-                id=channel_id
+                part=CHANNEL_PARTS,
+                id=",".join(channel_ids),
+                maxResults=50,
+                fields=CHANNEL_FIELDS
             )
-            res = req.execute()
-            if not res.get('items'):
-                return None
-
-            ch = res['items'][0]
-            snippet = ch.get('snippet', {})
-            stats = ch.get('statistics', {})
-            content_details = ch.get('contentDetails', {})
-            topic_details = ch.get('topicDetails', {})
-            status = ch.get('status', {})
-
-            return {
-                'channel_id': channel_id,
-                'channel_handle': snippet.get('customUrl', ''),
-                'channel_title': snippet.get('title', ''),
-                'channel_description': snippet.get('description', '')[:1000],
-                'subscriber_count': int(stats.get('subscriberCount', 0) or 0),
-                'video_count': int(stats.get('videoCount', 0) or 0),
-                'view_count': int(stats.get('viewCount', 0) or 0),
-                'uploads_playlist_id': content_details.get('relatedPlaylists', {}).get('uploads'),
-                'country': snippet.get('country', ''),
-                'published_at': snippet.get('publishedAt'),
-                'topic_categories': '|'.join(topic_details.get('topicCategories', [])),
-                'made_for_kids': status.get('madeForKids', False),
-                'privacy_status': status.get('privacyStatus', '')
-            }
+            res = self._execute_with_retry(req)
+            for ch in res.get('items', []):
+                infos[ch['id']] = _channel_info(ch)
+        except HttpError as e:
+            if self.is_key_error(e):
+                raise
+            logger.error("Error getting channel info for %d channels: %s", len(channel_ids), e)
         except Exception as e:
-            logger.error(f"Error getting channel info {channel_id}: {e}")
-            return None
+            logger.error("Error getting channel info for %d channels: %s", len(channel_ids), e)
+        return infos
 
-    def get_channel_videos(self, youtube, uploads_playlist_id):
-        videos = []
-        token = None
+    def iter_video_id_pages(self, youtube, uploads_playlist_id, token=None):
+        """
+        Yield (video_ids, next_token) for an uploads playlist one page (up to 50 ids) at a
+        time, starting at page token (None: the first page).
+        """
         while True:
             try:
                 req = youtube.playlistItems().list(
-                    part="snippet,contentDetails",
+                    part="contentDetails",
                     playlistId=uploads_playlist_id,
                     maxResults=50,
-                    pageToken=token
+                    pageToken=token,
+                    fields="items/contentDetails/videoId,nextPageToken"
                 )
-                res = req.execute()
-                for item in res.get('items', []):
-                    videos.append({
-                        'video_id': item['contentDetails']['videoId'],
-                        'title': item['snippet']['title'],
-                        'description': item['snippet']['description'][:1000],
-                        'video_published': item['snippet']['publishedAt'],
-                        'video_url': f"https://www.youtube.com/watch?v={item['contentDetails']['videoId']}",
-                        'channel_title_video': item['snippet']['channelTitle']
-                    })
-                token = res.get('nextPageToken')
-                if not token:
-                    break
-                time.sleep(0.2)
-            except Exception as e:
-                logger.error(f"Error fetching videos: {e}")
-                break
-        return videos
-
-    def get_video_statistics(self, youtube, video_ids):
-        stats = {}
-        for i in range(0, len(video_ids), 50):
-            batch = video_ids[i:i+50]
-            try:
-                req = youtube.videos().list(
-                    part="statistics,snippet,contentDetails,status",
-                    id=",".join(batch)
-                )
-                res = req.execute()
-                for item in res.get('items', []):
-                    st = item.get('statistics', {})
-                    sn = item.get('snippet', {})
-                    cd = item.get('contentDetails', {})
-                    stt = item.get('status', {})
-                    stats[item['id']] = {
-                        'likes': int(st.get('likeCount', 0) or 0),
-                        'comments': int(st.get('commentCount', 0) or 0),
-                        'views': int(st.get('viewCount', 0) or 0),
-                        'tags': ','.join(sn.get('tags', [])),
-                        'duration': cd.get('duration', ''),
-                        'definition': sn.get('definition', ''),
-                        'category_id': sn.get('categoryId', ''),
-                        'license': stt.get('license', ''),
-                        'video_made_for_kids': stt.get('madeForKids', False)
-                    }
-                time.sleep(0.5)
+                res = self._execute_with_retry(req)
+            except HttpError as e:
+                if self.is_key_error(e):
+                    raise
+                logger.error("Error fetching videos: %s", e)
+                return
             except Exception as e:
-                logger.error(f"Error getting video stats batch {i//50 + 1}: {e}")
-        return stats
+                logger.error("Error fetching videos: %s", e)
+                return
+            page = [item['contentDetails']['videoId'] for item in res.get('items', [])]
+            token = res.get('nextPageToken')
+            if page:
+                yield page, token
+            if not token:
+                return
+
+    def call_on_pool(self, limiter, fn, *args):
+        """Run fn on a key's API-pool thread under the key's rate limiter and this thread's own Http."""
+        self.local.limiter = limiter
+        if getattr(self.local, 'http', None) is None:
+            self.local.http = httplib2.Http(timeout=HTTP_TIMEOUT)
+        return fn(*args)
+
+    def submit_api_call(self, fn, *args):
+        """Submit fn(*args) to the calling worker's key's API pool, paced by the key's rate limiter."""
+        return self.local.api_pool.submit(self.call_on_pool, self.local.limiter, fn, *args)
+
+    def fetch_video_batch(self, youtube, ch_prefix, batch):
+        """Fetch one videos.list batch and return its records."""
+        req = youtube.videos().list(
+            part=VIDEO_PARTS,
+            id=",".join(batch),
+            fields=VIDEO_FIELDS
+        )
+        res = self._execute_with_retry(req)
+        return [_video_record(ch_prefix, item) for item in res.get('items', [])]
+
+    def video_group_dispatcher(self, api_key):
+        """Return a VideoBatcher dispatch that runs each group on api_key's API pool under its limiter."""
+        def dispatch(group):
+            self.api_pools[api_key].submit(self.call_on_pool, self.limiters[api_key], self.fetch_video_group, self.clients[api_key], group)
+        return dispatch
+
+    def fetch_video_group(self, youtube, group):
+        """
+        Fetch the short pages coalesced by a VideoBatcher with one videos.list call and
+        complete each page's future with its own records (or the call's error).
+        """
+        group = [(ch_prefix, ids, fut) for ch_prefix, ids, fut in group if fut.set_running_or_notify_cancel()]
+        if not group:
+            return
+        try:
+            req = youtube.videos().list(
+                part=VIDEO_PARTS,
+                id=",".join(itertools.chain.from_iterable(ids for _, ids, _ in group)),
+                fields=VIDEO_FIELDS
+            )
+            items = {item['id']: item for item in self._execute_with_retry(req).get('items', [])}
+        except Exception as e:
+            for _, _, fut in group:
+                fut.set_exception(e)
+            return
+        for ch_prefix, ids, fut in group:
+            fut.set_result([_video_record(ch_prefix, items[v]) for v in ids if v in items])
+
+    def iter_video_records(self, youtube, ch_info, page_token=None):
+        """
+        Yield (records, next_token) for a channel one playlist page at a time, starting at
+        page_token. Each page's videos.list call
+        runs on the API pool while the next playlist page is fetched, with at most
+        API_POOL_WORKERS pages in flight, so memory stays bounded for any channel size.
+        Short pages go through the key's VideoBatcher to share a call with other channels.
+        """
+        ch_prefix = tuple(ch_info[c] for c in CHANNEL_COLUMNS)
+        batcher = getattr(self.local, 'batcher', None)
+        in_flight = deque()
+        try:
+            pages = self.iter_video_id_pages(youtube, ch_info['uploads_playlist_id'], page_token)
+            for n, (page, next_token) in enumerate(pages, 1):
+                if batcher is not None and len(page) < batcher.max_ids:
+                    fut = batcher.submit(ch_prefix, page)
+                else:
+                    fut = self.submit_api_call(self.fetch_video_batch, youtube, ch_prefix, page)
+                in_flight.append((n, fut, next_token))
+                while in_flight and (in_flight[0][1].done() or len(in_flight) >= API_POOL_WORKERS):
+                    n, fut, next_token = in_flight.popleft()
+                    yield self.video_batch_result(n, fut), next_token
+            while in_flight:
+                n, fut, next_token = in_flight.popleft()
+                yield self.video_batch_result(n, fut), next_token
+        finally:
+            for _, fut, _ in in_flight:
+                fut.cancel()
+
+    def video_batch_result(self, n, fut):
+        """Return a finished fetch_video_batch's records ([] on failure). Key errors propagate."""
+        try:
+            return fut.result()
+        except HttpError as e:
+            if self.is_key_error(e):
+                raise
+            logger.error("Error getting video details batch %d: %s", n, e)
+        except Exception as e:
+            logger.error("Error getting video details batch %d: %s", n, e)
+        return []
+
+    def get_write_connection(self):
+        if self.write_conn is None or self.write_conn.closed:
+            if self.write_conn is not None:
+                self.pool.putconn(self.write_conn)
+            self.write_conn = self.pool.getconn()
+        return self.write_conn
+
+    def commit_batch(self, processed_rows, last_handle):
+        """Commit all records saved since the last checkpoint, then save the checkpoint."""
+        if self.write_conn is not None and not self.write_conn.closed:
+            self.write_conn.commit()
+        self.save_checkpoint(processed_rows, last_handle)
 
     def save_data_batch(self, records):
+        """
+        Upsert record tuples (in COLUMNS order) in the open write transaction;
+        committed later by commit_batch.
+        """
         if not records:
             return
+        # A channel handed back mid-scrape is rescraped from the start, so its first pages
+        # can appear twice in one batch; keep the last copy so the upsert hits each row once
+        unique = {(r[0], r[_VIDEO_ID_INDEX]): r for r in records}
+        if len(unique) < len(records):
+            records = list(unique.values())
+        conn = self.get_write_connection()
+        cur = conn.cursor()
+        try:
+            # Savepoint so a failed channel doesn't discard other channels pending in this transaction
+            cur.execute("SAVEPOINT save_data_batch")
+            if len(records) < COPY_MIN_RECORDS:
+                # One statement with one typed array per column: a single round-trip and plan
+                arrays = [list(col) for col in zip(*records)]
+                cur.execute(UNNEST_INSERT_SQL, arrays)
+            else:
+                # COPY into a session-local staging table, then upsert from it in one statement
+                buf = io.StringIO()
+                for r in records:
+                    buf.write('\t'.join(_format_value_for_copy(v) for v in r))
+                    buf.write('\n')
+                buf.seek(0)
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS tmp_youtube
+                    (LIKE recycle_bin.youtube_scraped_data INCLUDING DEFAULTS)
+                    ON COMMIT DELETE ROWS
+                """)
+                cur.execute("TRUNCATE tmp_youtube")
+                cur.copy_expert(COPY_STAGING_SQL, buf)
+                cur.execute(STAGING_INSERT_SQL)
+            cur.execute("RELEASE SAVEPOINT save_data_batch")
+            logger.info("💾 Saved %d records", len(records))
+        except Exception as e:
+            logger.error("Error saving batch: %s", e)
+            cur.execute("ROLLBACK TO SAVEPOINT save_data_batch")
+        finally:
+            cur.close()
+
+    def update_partial_channels(self, progressed, finished):
+        """
+        Mark/unmark channels as partially written, in the same transaction as their records.
+        progressed maps channel_id to the page token after its last written page.
+        """
+        if not progressed and not finished:
+            return
+        conn = self.get_write_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("SAVEPOINT partial_channels")
+            if progressed:
+                cur.execute("""
+                    INSERT INTO recycle_bin.youtube_scrape_partial (channel_id, page_token)
+                    SELECT * FROM unnest(%s::varchar[], %s::varchar[])
+                    ON CONFLICT (channel_id) DO UPDATE SET page_token = EXCLUDED.page_token
+                """, (list(progressed), list(progressed.values())))
+            if finished:
+                cur.execute(
+                    "DELETE FROM recycle_bin.youtube_scrape_partial WHERE channel_id = ANY(%s)",
+                    (list(finished),)
+                )
+            cur.execute("RELEASE SAVEPOINT partial_channels")
+        except Exception as e:
+            logger.error("Error updating partial channels: %s", e)
+            cur.execute("ROLLBACK TO SAVEPOINT partial_channels")
+        finally:
+            cur.close()
+
+    def load_processed_channels(self):
+        """Load every fully scraped channel_id so skip checks need no DB round-trip."""
         with self.get_db_connection() as conn:
             cur = conn.cursor()
-            columns = [
-                'channel_id', 'channel_handle', 'channel_title', 'channel_description',
-                'subscriber_count', 'video_count', 'view_count', 'uploads_playlist_id',
-                'country', 'published_at', 'topic_categories', 'made_for_kids', 'privacy_status',
-                'video_id', 'title', 'description', 'video_published', 'video_url', 'channel_title_video',
-                'tags', 'likes', 'comments', 'views', 'duration', 'definition', 'category_id',
-                'license', 'video_made_for_kids'
-            ]
-            data = [tuple(r.get(c) for c in columns) for r in records]
-            try:
-                execute_values(cur, f"""
-                    INSERT INTO recycle_bin.youtube_scraped_data
-                    ({", ".join(columns)})
-                    VALUES %s
-                    ON CONFLICT (channel_id, video_id) DO UPDATE SET
-                        channel_title = EXCLUDED.channel_title,
-                        title = EXCLUDED.title,
-                        views = EXCLUDED.views,
-                        likes = EXCLUDED.likes,
-                        comments = EXCLUDED.comments,
-                        scraped_at = CURRENT_TIMESTAMP
-                """, data, page_size=100)
-                conn.commit()
-                logger.info(f"💾 Saved {len(records)} records")
-            except Exception as e:
-                logger.error(f"Error saving batch: {e}")
-                conn.rollback()
-            finally:
-                cur.close()
+            cur.execute("""
+                SELECT channel_id FROM recycle_bin.youtube_scraped_data
+                EXCEPT
+                SELECT channel_id FROM recycle_bin.youtube_scrape_partial
+            """)
+            processed = {row[0] for row in cur}
+            cur.close()
+        logger.info("📚 %d channels already in DB", len(processed))
+        return processed
 
-    def is_channel_processed(self, channel_id):
+    def load_resume_tokens(self):
+        """Load the saved playlist page token of every partially scraped channel."""
         with self.get_db_connection() as conn:
             cur = conn.cursor()
-            cur.execute(
-                "SELECT COUNT(*) FROM recycle_bin.youtube_scraped_data WHERE channel_id = %s",
-                (channel_id,)
-            )
-            count = cur.fetchone()[0]
+            cur.execute("SELECT channel_id, page_token FROM recycle_bin.youtube_scrape_partial")
+            tokens = dict(cur.fetchall())
             cur.close()
-            return count > 0
+        if tokens:
+            logger.info("↪️ %d partially scraped channels will resume where they stopped", len(tokens))
+        return tokens
+
+    def is_channel_processed(self, channel_id):
+        return channel_id in self.processed_channels
+
+    def load_handle_cache(self):
+        cache = {}
+        if os.path.exists(HANDLE_CACHE_FILE):
+            try:
+                with open(HANDLE_CACHE_FILE, 'rb') as f:
+                    for line in f:
+                        try:
+                            entry = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            continue  # torn line from an interrupted append
+                        cache[entry['handle']] = (entry.get('channel_id'), entry.get('ts', 0))
+            except Exception as e:
+                logger.warning("Error loading handle cache: %s", e)
+        return cache
+
+    def cache_handle(self, key, channel_id):
+        """Remember a handle lookup (channel_id None for a miss) in memory and on disk."""
+        entry = {'handle': key, 'channel_id': channel_id, 'ts': time.time()}
+        with self.handle_cache_lock:
+            self.handle_cache[key] = (channel_id, entry['ts'])
+            try:
+                with open(HANDLE_CACHE_FILE, 'ab') as f:
+                    f.write(orjson.dumps(entry) + b'\n')
+            except Exception as e:
+                logger.warning("Error saving handle cache: %s", e)
 
     def load_checkpoint(self):
         if os.path.exists(CHECKPOINT_FILE):
             try:
-                with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(CHECKPOINT_FILE, 'rb') as f:
+                    return orjson.loads(f.read())
             except Exception as e:
-                logger.warning(f"Error loading checkpoint: {e}")
+                logger.warning("Error loading checkpoint: %s", e)
         return {"processed_rows": 0}
 
     def save_checkpoint(self, processed_rows, last_handle):
@@ -370,104 +863,422 @@ class YouTubeScraper:
             "last_handle": last_handle,
             "timestamp": datetime.now().isoformat()
         }
+        # Write to a temp file and rename over the old one so a crash never leaves a truncated checkpoint
+        tmp = CHECKPOINT_FILE + '.tmp'
         try:
-            with open(CHECKPOINT_FILE, 'w', encoding='utf-8') as f:
-                json.dump(checkpoint, f, indent=2, ensure_ascii=False)
+            with open(tmp, 'wb') as f:
+                f.write(orjson.dumps(checkpoint))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, CHECKPOINT_FILE)
         except Exception as e:
             logger.error(f"Error saving checkpoint: {e}")
 
-    def process_channel(self, handle, row_index):
-        api_key = self.get_working_api_key()
-        if not api_key:
-            return False  # all keys exhausted
-
-        youtube = self.setup_youtube_api(api_key)
-        records = []
+    def resolve_channel(self, youtube, handle):
+        """
+        Return (channel_id, info) to scrape for handle (info may be None), or None if
+        unresolved or already in the DB.
+        """
         try:
-            channel_id = self.get_channel_id_from_handle(youtube, handle)
-            if not channel_id:
-                logger.warning(f"No channel ID for {handle}")
-                return True
-
-            if self.is_channel_processed(channel_id):
-                logger.info(f"Channel {channel_id} already processed")
-                return True
+            channel_id, info = self.lookup_channel(youtube, handle)
+        except HttpError as e:
+            if self.is_key_error(e):
+                raise
+            logger.error("HTTP error for %s: %s", handle, e)
+            return None
+        if not channel_id:
+            logger.warning("No channel ID for %s", handle)
+            return None
+        if self.is_channel_processed(channel_id):
+            logger.info("Channel %s already processed", channel_id)
+            return None
+        return channel_id, info
 
-            ch_info = self.get_channel_info(youtube, channel_id)
+    def scrape_channel(self, youtube, row, handle, ch_info, insert_queue):
+        """
+        Stream one channel's records to the DB writer page by page, each with the token
+        of the page after it, then send its final marker. A partially written channel
+        resumes from its last written page. Key errors propagate without the marker,
+        so the writer never counts a half-scraped channel as done.
+        """
+        channel_id = ch_info['channel_id'] if ch_info else None
+        try:
             if not ch_info or not ch_info.get('uploads_playlist_id'):
-                logger.warning(f"No uploads playlist for {channel_id}")
-                return True
-
-            videos = self.get_channel_videos(youtube, ch_info['uploads_playlist_id'])
-            if not videos:
-                logger.info(f"No videos for {channel_id}")
-                return True
-
-            video_ids = [v['video_id'] for v in videos]
-            vstats = self.get_video_statistics(youtube, video_ids)
-
-            for v in videos:
-                rec = {**ch_info, **v}
-                rec.update(vstats.get(v['video_id'], {}))
-                rec['description'] = v.get('description', '')
-                rec['video_published'] = v.get('video_published')
-                records.append(rec)
-
-            self.save_data_batch(records)
-            logger.info(f"✅ {handle} ({len(videos)} videos)")
-            return True
+                logger.warning("No uploads playlist for %s", handle)
+            else:
+                count = 0
+                page_token = self.resume_tokens.get(channel_id)
+                if page_token:
+                    logger.info("↪️ %s resuming after its last written page", handle)
+                for records, next_token in self.iter_video_records(youtube, ch_info, page_token):
+                    if self.abort_requested.is_set():
+                        return  # no final marker: the channel stays unfinished and resumes after its last written page
+                    if records:
+                        self.enqueue(insert_queue, (row, handle, channel_id, records, False, next_token))
+                        count += len(records)
+                if count:
+                    logger.info("✅ %s (%d videos)", handle, count)
+                else:
+                    logger.info("No videos for %s", channel_id)
 
         except HttpError as e:
-            msg = str(e).lower()
-            if 'quotaexceeded' in msg or 'dailylimitexceeded' in msg:
-                logger.error(f"🌡️ RATE LIMIT EXHAUSTED while processing {handle}")
-                return False
-            logger.error(f"HTTP error for {handle}: {e}")
-            return True
+            if self.is_key_error(e):
+                raise
+            logger.error("HTTP error for %s: %s", handle, e)
         except Exception as e:
-            logger.error(f"Unexpected error for {handle}: {e}")
-            return True
+            logger.error("Unexpected error for %s: %s", handle, e)
+        self.enqueue(insert_queue, (row, handle, channel_id, [], True, None))
 
-    def run(self):
+    def process_window(self, youtube, window, insert_queue, total, key_idx):
+        """
+        Scrape a window of (row, handle) tasks: resolve all handles concurrently on the
+        API pool (forHandle hits come back with channel details), then fetch details for
+        the rest of the window with a single channels.list call that overlaps scraping
+        the channels whose details are already known. Tasks are removed from
+        window once fully handed to the DB writer, so after a quota error window holds
+        what is left.
+        """
+        lookups = [(task, self.submit_api_call(self.resolve_channel, youtube, task[1])) for task in window]
+        channel_ids = {}
+        infos = {}
         try:
-            df = pd.read_csv(INPUT_FILE)
-        except Exception as e:
-            logger.error(f"❌ Cannot read {INPUT_FILE}: {e}")
+            for task, fut in lookups:
+                row, handle = task
+                resolved = fut.result()
+                if resolved:
+                    channel_ids[row], info = resolved
+                    if info:
+                        infos[channel_ids[row]] = info
+                else:
+                    window.remove(task)
+                    self.enqueue(insert_queue, (row, handle, None, [], True, None))
+        finally:
+            for _, fut in lookups:
+                fut.cancel()
+        if not window:
             return
 
-        if 'channel_user' not in df.columns:
-            for col in df.columns:
-                if df[col].astype(str).str.startswith('@').any():
-                    df.rename(columns={col: 'channel_user'}, inplace=True)
-                    break
-            else:
-                logger.error("❌ No @handle column found")
+        # Details for the rest come from one channels.list call on the API pool, while the
+        # channels that already have them are scraped first
+        missing = [cid for cid in dict.fromkeys(channel_ids.values()) if cid not in infos]
+        missing_info = self.submit_api_call(self.get_channels_info, youtube, missing) if missing else None
+        try:
+            for task in sorted(window, key=lambda t: channel_ids[t[0]] not in infos):
+                if self.stop_requested.is_set():
+                    return
+                row, handle = task
+                if channel_ids[row] not in infos and missing_info is not None:
+                    infos.update(missing_info.result())
+                    missing_info = None
+                logger.debug("[%d/%d] %s (key %d)", row + 1, total, handle, key_idx + 1)
+                self.scrape_channel(youtube, row, handle, infos.get(channel_ids[row]), insert_queue)
+                window.remove(task)
+        finally:
+            if missing_info is not None:
+                missing_info.cancel()
+
+    def tasks_left(self):
+        """Number of rows not yet handed to a worker, including rows handed back. Call under tasks_cond."""
+        return len(self.returned_tasks) + len(self.handles) - self.next_task
+
+    def next_window(self):
+        """
+        Take this worker's share of tasks (at most CHANNEL_INFO_BATCH), waiting while other
+        workers still hold windows they might hand back. Returns [] once all work is done.
+        Handed-back rows go first so the checkpoint prefix can advance past them.
+        """
+        with self.tasks_cond:
+            while True:
+                if self.stop_requested.is_set():
+                    return []
+                # Split what is left among the workers of keys that still have quota
+                live_workers = max(1, self.num_workers - WORKERS_PER_KEY * len(self.exhausted_keys))
+                share = max(1, min(CHANNEL_INFO_BATCH, self.tasks_left() // live_workers))
+                window = []
+                while self.returned_tasks and len(window) < share:
+                    window.append(self.returned_tasks.popleft())
+                end = self.next_task
+                while end < len(self.handles) and len(window) < share:
+                    if end not in self.duplicate_rows:
+                        window.append((end, self.handles[end]))
+                    end += 1
+                self.next_task = end
+                if window:
+                    self.active_windows += 1
+                    return window
+                if self.active_windows == 0:
+                    return window
+                self.tasks_cond.wait()
+
+    def worker(self, key_idx, api_key, insert_queue, total):
+        """
+        Scrape channels with API key api_key until none are left or the key is exhausted.
+        The key's WORKERS_PER_KEY workers share its client and rate limiter, each with
+        its own Http, so one key keeps several channels in flight.
+        """
+        youtube = self.clients[api_key]
+        self.local.limiter = self.limiters[api_key]
+        self.local.batcher = self.batchers[api_key]
+        self.local.api_pool = self.api_pools[api_key]
+        self.local.http = httplib2.Http(timeout=HTTP_TIMEOUT)
+        while api_key not in self.exhausted_keys:
+            window = self.next_window()
+            if not window:
+                return
+            exhausted = None
+            try:
+                self.process_window(youtube, window, insert_queue, total, key_idx)
+            except HttpError as e:
+                # Only key errors get past the per-channel handlers: retire the key
+                exhausted = e
+            finally:
+                with self.tasks_cond:
+                    # Hand unfinished channels back for the remaining keys
+                    self.returned_tasks.extend(window)
+                    self.active_windows -= 1
+                    if exhausted:
+                        first = api_key not in self.exhausted_keys
+                        self.exhausted_keys.add(api_key)
+                        if not self.is_quota_error(exhausted):
+                            self.rejected_keys.add(api_key)
+                    self.tasks_cond.notify_all()
+            if exhausted:
+                if first and self.is_quota_error(exhausted):
+                    logger.warning("🔒 Key %d quota exhausted until midnight PT, %d channels handed back", key_idx + 1, len(window))
+                elif first:
+                    logger.error("🔑 Key %d rejected by the API, retired for this run, %d channels handed back: %s", key_idx + 1, len(window), exhausted)
+                return
+
+    def db_writer(self, insert_queue, start_row, skip_rows):
+        """
+        Drain (row, handle, channel_id, records, final, next_token) items from insert_queue,
+        insert them in batches of about WRITE_BATCH_RECORDS records, and checkpoint the
+        longest contiguous run of finished rows so a restart never skips an unfinished
+        channel. Channels with some but not all pages committed are tracked in
+        youtube_scrape_partial, with the page token to resume from, within the same
+        transaction. skip_rows ({row: handle}) are never dispatched and count as
+        finished from the start. If a flush fails, the run is stopped and the rest of
+        the queue is drained unwritten, so workers never block on it; the checkpoint
+        stays at the last successful commit.
+        """
+        buffer, pending = [], []
+        done = dict(skip_rows)  # finished row index -> handle, beyond the contiguous prefix
+        next_row = start_row
+        last_handle = self.checkpoint.get("last_handle")
+        open_channels = set()  # channels with records written but no final item yet
+        progressed, finished = {}, set()  # changes to apply at the next flush
+        while True:
+            item = insert_queue.get()
+            if self.writer_failed:
+                if item is None:
+                    return
+                continue
+            if item is not None:
+                row, handle, channel_id, records, final, next_token = item
+                buffer.extend(records)
+                if not final and next_token is not None:
+                    open_channels.add(channel_id)
+                    progressed[channel_id] = next_token
+                elif not final:
+                    # Last page: once it is committed every page is written, so the partial row
+                    # goes now (a NULL token would mean "rescrape from the start")
+                    open_channels.discard(channel_id)
+                    progressed.pop(channel_id, None)
+                    finished.add(channel_id)
+                else:
+                    pending.append((row, handle))
+                    if channel_id in open_channels or channel_id in self.resume_tokens:
+                        open_channels.discard(channel_id)
+                        finished.add(channel_id)
+            if item is None or (pending or buffer) and (len(buffer) >= WRITE_BATCH_RECORDS or len(pending) >= BATCH_SIZE):
+                try:
+                    self.save_data_batch(buffer)
+                    # Channels that also finished in this batch need no partial row at all
+                    for channel_id in finished:
+                        progressed.pop(channel_id, None)
+                    self.update_partial_channels(progressed, finished)
+                    self.processed_channels.update(finished)
+                    done.update(pending)
+                    while next_row in done:
+                        last_handle = done.pop(next_row)
+                        next_row += 1
+                    self.commit_batch(next_row, last_handle)
+                    # A channel handed back mid-run resumes from its committed pages too
+                    self.resume_tokens.update(progressed)
+                    for channel_id in finished:
+                        self.resume_tokens.pop(channel_id, None)
+                    logger.info("📝 Batch checkpoint: %d channels, resume row %d", len(pending), next_row)
+                except Exception as e:
+                    logger.error("❌ Database write failed, stopping the run: %s", e)
+                    self.writer_failed = True
+                    self.stop_requested.set()
+                    try:
+                        self.write_conn.rollback()
+                    except Exception:
+                        pass
+                buffer, pending = [], []
+                progressed, finished = {}, set()
+            if item is None:
+                return
+
+    def enqueue(self, insert_queue, item):
+        """
+        Put item on the bounded insert_queue. If the writer thread has died the item is
+        dropped and the run is stopped, so no worker blocks forever on a full queue.
+        """
+        while True:
+            try:
+                insert_queue.put(item, timeout=1)
                 return
+            except queue.Full:
+                if not self.writer.is_alive():
+                    self.stop_requested.set()
+                    return
+
+    def request_stop(self, signum, frame):
+        """
+        SIGINT handler: stop taking channels. A second Ctrl+C abandons in-flight channels
+        at their next page (they resume from it on rerun); a third raises KeyboardInterrupt.
+        """
+        if self.stop_requested.is_set():
+            logger.warning("⏹️ Second interrupt, abandoning in-flight channels at their next page (Ctrl+C again to kill)")
+            self.abort_requested.set()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            return
+        logger.warning("⏸️ Interrupt received, finishing in-flight channels (Ctrl+C again to abort)")
+        self.stop_requested.set()
+
+    def load_handles(self):
+        """Return the handle column of INPUT_FILE as a list of strings, or None if it can't be used."""
+        try:
+            with open(INPUT_FILE, newline='', encoding='utf-8-sig') as f:
+                # Blank lines are skipped, as pandas did, so row numbers in old checkpoints still line up
+                reader = (row for row in csv.reader(f) if row)
+                header = next(reader, [])
+                sample = list(itertools.islice(reader, 50))
+                if 'channel_user' in header:
+                    col = header.index('channel_user')
+                else:
+                    # Detect the handle column from a small sample of rows
+                    col = next(
+                        (c for c in range(len(header)) if any(len(r) > c and r[c].startswith('@') for r in sample)),
+                        None
+                    )
+                    if col is None:
+                        logger.error("❌ No @handle column found")
+                        return None
+                return [
+                    row[col].strip() if len(row) > col else ''
+                    for row in itertools.chain(sample, reader)
+                ]
+        except Exception as e:
+            logger.error("❌ Cannot read %s: %s", INPUT_FILE, e)
+            return None
+
+    def run(self):
+        handles = self.load_handles()
+        if handles is None:
+            return
+
+        if not API_KEYS:
+            logger.error("🛑 No API keys loaded")
+            return
+
+        # One client per key, built before any worker starts so a key's workers share it
+        self.clients = {key: self.setup_youtube_api(key) for key in API_KEYS}
 
         start_row = self.checkpoint.get("processed_rows", 0)
-        total = len(df)
-        logger.info(f"🚀 Starting from row {start_row}/{total}")
-
-        batch_counter = 0
-        for i in range(start_row, total):
-            handle = str(df.iloc[i]['channel_user']).strip()
-            logger.info(f"[{i+1}/{total}] {handle}")
-
-            success = self.process_channel(handle, i)
-            if success:
-                batch_counter += 1
-                self.save_checkpoint(i + 1, handle)
-                if batch_counter % BATCH_SIZE == 0:
-                    logger.info(f"📝 Batch checkpoint: {batch_counter} channels")
-                    batch_counter = 0
-            else:
-                logger.error("🛑 ALL API QUOTAS EXHAUSTED. Restart later.")
-                break
+        total = len(handles)
+        self.num_workers = len(API_KEYS) * WORKERS_PER_KEY
+        logger.info("🚀 Starting from row %d/%d with %d workers on %d keys", start_row, total, self.num_workers, len(API_KEYS))
+
+        # Repeats of a handle seen earlier in the file are never dispatched; the writer counts them as done
+        seen = set()
+        duplicates = {}
+        for i, handle in enumerate(handles):
+            key = handle.lstrip('@').lower()
+            if key in seen and i >= start_row:
+                duplicates[i] = handle
+            seen.add(key)
+        if duplicates:
+            logger.info("🔁 Skipping %d duplicate handles", len(duplicates))
+
+        # Tasks are (row, handle); rows are dispatched by index, guarded by tasks_cond
+        self.handles = handles
+        self.duplicate_rows = duplicates
+        self.next_task = start_row  # first row never handed to a worker
+        self.returned_tasks = deque()  # rows handed back by exhausted or stopped workers
+        # Bounded so a slow database applies backpressure to the workers instead of growing memory
+        insert_queue = queue.Queue(maxsize=INSERT_QUEUE_MAX_ITEMS)
+
+        writer = self.writer = threading.Thread(target=self.db_writer, args=(insert_queue, start_row, duplicates), name="db-writer")
+        writer.start()
+        self.tasks_cond = threading.Condition()
+        self.active_windows = 0  # windows handed to workers and not yet finished
+        previous_handler = signal.signal(signal.SIGINT, self.request_stop)
+        self.limiters = {key: RateLimiter(REQUESTS_PER_SECOND_PER_KEY, REQUEST_BURST_PER_KEY) for key in API_KEYS}
+        self.api_pools = {
+            key: ThreadPoolExecutor(max_workers=API_POOL_WORKERS, thread_name_prefix=f"api{idx + 1}")
+            for idx, key in enumerate(API_KEYS)
+        }
+        self.batchers = {key: VideoBatcher(self.video_group_dispatcher(key)) for key in API_KEYS}
+        crashed = 0  # workers that died on an unexpected exception
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="key") as pool:
+                futures = {
+                    pool.submit(self.worker, idx, key, insert_queue, total): idx
+                    for idx, key in enumerate(API_KEYS)
+                    for _ in range(WORKERS_PER_KEY)
+                }
+                for fut in as_completed(futures):
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        crashed += 1
+                        logger.error("❌ Worker for key %d crashed: %s", futures[fut] + 1, e)
+        finally:
+            # The writer only exits on the sentinel; if it is gone it died without draining the queue
+            writer_ok = writer.is_alive()
+            if writer_ok:
+                self.enqueue(insert_queue, None)
+            writer.join()
+            signal.signal(signal.SIGINT, previous_handler)
 
-            time.sleep(1.5)
+            if self.write_conn is not None:
+                self.pool.putconn(self.write_conn)
+                self.write_conn = None
+            self.pool.closeall()
+            for batcher in self.batchers.values():
+                batcher.close()
+            for api_pool in self.api_pools.values():
+                api_pool.shutdown()
 
-        logger.info("🎉 Scraping completed!")
-        logger.info("📊 Check data: SELECT COUNT(*) FROM recycle_bin.youtube_scraped_data;")
+        if self.writer_failed or not writer_ok:
+            logger.error("🛑 Database writes failed; progress up to the last checkpoint is saved, rerun to resume.")
+            return
+
+        if self.stop_requested.is_set():
+            logger.info("⏸️ Stopped by user; progress checkpointed, rerun to resume.")
+            return
+
+        if not self.tasks_left():
+            logger.info("🎉 Scraping completed!")
+            logger.info("📊 Check data: SELECT COUNT(*) FROM recycle_bin.youtube_scraped_data;")
+            return
+
+        # Work is left: report why the workers stopped
+        if crashed:
+            logger.error("🛑 %d workers crashed (see errors above); %d rows left, rerun to resume.", crashed, self.tasks_left())
+        elif self.exhausted_keys and self.rejected_keys == self.exhausted_keys:
+            logger.error("🛑 ALL API KEYS REJECTED (invalid, expired or blocked); fix them in .env and rerun.")
+        else:
+            if self.rejected_keys:
+                logger.error("🔑 %d API keys were rejected; fix them in .env.", len(self.rejected_keys))
+            reset = _next_quota_reset()
+            if reset is not None:
+                logger.error("🛑 ALL API QUOTAS EXHAUSTED. Quotas reset at %s local time; restart then.", reset.strftime("%Y-%m-%d %H:%M"))
+            else:
+                logger.error("🛑 ALL API QUOTAS EXHAUSTED. Restart later.")
 
 
 if __name__ == "__main__":